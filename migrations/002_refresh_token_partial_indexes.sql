@@ -0,0 +1,22 @@
+-- =============================================================================
+-- GreenOps — migrations/002_refresh_token_partial_indexes.sql
+--
+-- Partial indexes for the refresh-token hot paths.
+--
+-- /refresh and /logout both look up tokens with
+--     WHERE token_hash = :h AND revoked = false
+-- The full ix_refresh_tokens_token_hash index keeps every revoked row
+-- forever; a partial index over the active subset stays small and turns the
+-- lookup into a couple of buffer fetches regardless of token churn.
+-- The user_id partial index serves revoke-all-sessions style scans.
+--
+-- Plain CREATE INDEX (not CONCURRENTLY): migrate.sh applies each file inside
+-- a single transaction, where CONCURRENTLY is not allowed. The migrate
+-- service runs before the app starts, so there is no live traffic to block.
+-- =============================================================================
+
+CREATE INDEX IF NOT EXISTS ix_refresh_tokens_token_hash_active
+    ON refresh_tokens(token_hash) WHERE revoked = false;
+
+CREATE INDEX IF NOT EXISTS ix_refresh_tokens_user_id_active
+    ON refresh_tokens(user_id) WHERE revoked = false;
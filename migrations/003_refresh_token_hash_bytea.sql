@@ -0,0 +1,14 @@
+-- =============================================================================
+-- GreenOps — migrations/003_refresh_token_hash_bytea.sql
+--
+-- Store refresh-token hashes as raw 32-byte digests instead of 64-char hex
+-- text. Halves the bytes on the wire and in the B-tree, and lets asyncpg's
+-- binary protocol pass the digest through without a hex codec.
+--
+-- Existing rows are converted in place (decode of the hex text), so active
+-- sessions survive the migration. The unique constraint and the partial
+-- indexes from 002 are rebuilt automatically by the type change.
+-- =============================================================================
+
+ALTER TABLE refresh_tokens
+    ALTER COLUMN token_hash TYPE BYTEA USING decode(token_hash, 'hex');
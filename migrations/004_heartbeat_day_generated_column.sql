@@ -0,0 +1,22 @@
+-- =============================================================================
+-- GreenOps — migrations/004_heartbeat_day_generated_column.sql
+--
+-- Precompute the day bucket used by /api/dashboard/energy-trend.
+--
+-- The endpoint grouped on date_trunc('day', timestamp), recomputing the
+-- truncation per row on every request. A stored generated column computes
+-- it once at insert time; the BRIN index exploits the fact that heartbeats
+-- arrive in near-timestamp order, so a date-range scan touches only the
+-- block ranges for the requested window instead of the whole heap.
+--
+-- The expression avoids date_trunc on timestamptz (not immutable, so not
+-- allowed in a generated column): AT TIME ZONE 'UTC' + ::date is immutable
+-- and yields the same UTC day bucket.
+-- =============================================================================
+
+ALTER TABLE heartbeats
+    ADD COLUMN IF NOT EXISTS day DATE
+    GENERATED ALWAYS AS (((timestamp AT TIME ZONE 'UTC')::date)) STORED;
+
+CREATE INDEX IF NOT EXISTS ix_heartbeats_day_brin
+    ON heartbeats USING brin(day);
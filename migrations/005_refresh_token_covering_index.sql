@@ -0,0 +1,24 @@
+-- =============================================================================
+-- GreenOps — migrations/005_refresh_token_covering_index.sql
+--
+-- Upgrade the active-token lookup index to a covering index.
+--
+-- /refresh resolves WHERE token_hash = :h AND revoked = false and then
+-- reads user_id and expires_at from the row. With the plain partial index
+-- from migration 002 that costs a heap fetch per lookup; INCLUDE-ing the
+-- two payload columns lets the planner answer the probe with an
+-- index-only scan — no heap visit once the visibility map is set.
+-- The partial predicate keeps revoked rows out, so the index stays small
+-- under token churn.
+--
+-- Plain CREATE INDEX (not CONCURRENTLY): migrate.sh applies each file inside
+-- a single transaction, where CONCURRENTLY is not allowed. The migrate
+-- service runs before the app starts, so there is no live traffic to block.
+-- =============================================================================
+
+CREATE INDEX IF NOT EXISTS ix_refresh_tokens_token_hash_active_covering
+    ON refresh_tokens(token_hash) INCLUDE (user_id, expires_at)
+    WHERE revoked = false;
+
+-- Superseded by the covering variant above — same predicate, same key column.
+DROP INDEX IF EXISTS ix_refresh_tokens_token_hash_active;
@@ -0,0 +1,43 @@
+-- =============================================================================
+-- GreenOps — migrations/006_machines_hot_query_indexes.sql
+--
+-- Indexes for the machines-router hot queries.
+--
+--   * Sweep: mark_offline_machines filters status IN ('online','idle') AND
+--     last_seen < cutoff. A partial index over only the non-offline rows
+--     stays tiny (most of a mature fleet is offline at any instant) and
+--     turns the sweep probe into a few buffer reads.
+--   * List: keyset pagination orders by (last_seen DESC, id DESC); a
+--     matching composite index serves both the ordered scan and the
+--     row-value cursor comparison.
+--   * Search: leading-wildcard ILIKE on hostname/mac_address/ip_address
+--     cannot use a btree. pg_trgm GIN indexes support ILIKE '%term%'
+--     directly, converting the search branch from a seq scan to an index
+--     lookup. ip_address is nullable; NULL rows simply don't appear in
+--     the index.
+--
+-- The heartbeats endpoint needs no new index: ix_heartbeats_machine_id_timestamp
+-- already covers (machine_id, timestamp) and PostgreSQL scans it backwards
+-- for ORDER BY timestamp DESC.
+--
+-- Plain CREATE INDEX (not CONCURRENTLY): migrate.sh applies each file inside
+-- a single transaction, where CONCURRENTLY is not allowed. The migrate
+-- service runs before the app starts, so there is no live traffic to block.
+-- =============================================================================
+
+CREATE INDEX IF NOT EXISTS ix_machines_sweep
+    ON machines(last_seen) WHERE status IN ('online', 'idle');
+
+CREATE INDEX IF NOT EXISTS ix_machines_last_seen_id
+    ON machines(last_seen DESC, id DESC);
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS ix_machines_hostname_trgm
+    ON machines USING gin (hostname gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_machines_mac_address_trgm
+    ON machines USING gin (mac_address gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_machines_ip_address_trgm
+    ON machines USING gin (ip_address gin_trgm_ops);
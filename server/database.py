@@ -29,12 +29,15 @@ from sqlalchemy import (
     BigInteger,
     Boolean,
     Column,
+    Computed,
+    Date,
     DateTime,
     Double,
     Float,
     ForeignKey,
     Index,
     Integer,
+    LargeBinary,
     String,
     Text,
     text,
@@ -57,12 +60,17 @@ settings = get_settings()
 # Engine & session factory
 # ---------------------------------------------------------------------------
 
+# Pool sizing favors persistent connections over overflow: overflow
+# connections are opened and torn down per burst, paying the TCP + TLS +
+# auth handshake exactly when the server is busiest. A larger steady pool
+# with a small overflow keeps handshakes off the latency path for the
+# short-transaction endpoints (login/refresh/heartbeat).
 engine = create_async_engine(
     settings.DATABASE_URL,
     echo=settings.DEBUG,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
+    pool_size=20,
+    max_overflow=10,
     pool_timeout=30,
     pool_recycle=1800,
 )
@@ -183,6 +191,16 @@ class User(Base):
     refresh_tokens = relationship("RefreshToken", back_populates="user",
                                   cascade="all, delete-orphan")
 
+    @property
+    def role_str(self) -> str:
+        """
+        Lowercase wire form of the role. The column type already yields a
+        UserRole member, so this is a plain attribute read; the fallback
+        normalises legacy raw strings defensively.
+        """
+        role = self.role
+        return role.value if isinstance(role, UserRole) else str(role).lower()
+
 
 class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
@@ -190,7 +208,9 @@ class RefreshToken(Base):
     id         = Column(Integer, primary_key=True, index=True)
     user_id    = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"),
                         nullable=False, index=True)
-    token_hash = Column(String(256), unique=True, nullable=False, index=True)
+    # Raw 32-byte SHA-256 digest (BYTEA) — asyncpg's binary protocol ships
+    # it as-is, skipping the hex encode/decode of the old 64-char text form.
+    token_hash = Column(LargeBinary(32), unique=True, nullable=False, index=True)
     issued_at  = Column(DateTime(timezone=True), nullable=False,
                         server_default=text("NOW()"))
     expires_at = Column(DateTime(timezone=True), nullable=False)
@@ -242,6 +262,12 @@ class Heartbeat(Base):
                               nullable=False)
     timestamp        = Column(DateTime(timezone=True), nullable=False,
                               server_default=text("NOW()"))
+    # UTC day bucket, generated by the DB at insert time (see migration 004).
+    # Lets /energy-trend group on a stored, BRIN-indexed value instead of
+    # re-running date_trunc per row.
+    day              = Column(Date,
+                              Computed("((timestamp AT TIME ZONE 'UTC')::date)",
+                                       persisted=True))
     idle_seconds     = Column(Integer, nullable=False, default=0)
     cpu_usage        = Column(Float, nullable=True)
     memory_usage     = Column(Float, nullable=True)
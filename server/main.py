@@ -28,7 +28,7 @@ import structlog
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 
 from config import get_settings
 from database import verify_schema, engine
@@ -188,12 +188,25 @@ async def lifespan(app: FastAPI):
         )
         raise
 
+    # ── 5. Background maintenance tasks ──────────────────────────────────
+    # Coalesced agent_token.last_used writes (see utils/security.py).
+    from utils.security import agent_last_used_flush_loop, flush_agent_last_used
+
+    last_used_task = asyncio.create_task(agent_last_used_flush_loop())
+
     logger.info("greenops_ready", host="0.0.0.0", port=8000, environment=settings.ENV)
 
     yield  # ── Application serves requests ──────────────────────────────
 
     # ── Shutdown ─────────────────────────────────────────────────────────
     logger.info("greenops_shutting_down")
+    last_used_task.cancel()
+    try:
+        await last_used_task
+    except asyncio.CancelledError:
+        pass
+    # Drain whatever the cancelled loop hadn't flushed yet.
+    await flush_agent_last_used()
     await engine.dispose()
     logger.info("greenops_stopped")
 
@@ -205,6 +218,10 @@ def create_app() -> FastAPI:
 
     app = FastAPI(
         title="GreenOps API",
+        # orjson renders datetime/float-heavy payloads (MachineOut,
+        # HeartbeatOut rows) several times faster than stdlib json; setting
+        # it here covers every endpoint without touching route code.
+        default_response_class=ORJSONResponse,
         description="Green IT Infrastructure Monitoring Platform",
         version="2.0.0",
         docs_url="/api/docs"     if settings.ENV != "production" else None,
@@ -24,42 +24,121 @@ from typing import Optional
 
 import structlog
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field, field_validator
-from sqlalchemy import select, text
+from sqlalchemy import bindparam, lambda_stmt, select, text, update
 from sqlalchemy.exc import IntegrityError, DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from config import get_settings
 from database import RefreshToken, User, UserRole, get_db
 from utils.auth import (
     create_access_token,
     create_refresh_token,
     hash_password,
+    hash_password_async,
     hash_refresh_token,
     needs_rehash,
-    timing_safe_dummy_verify,
-    verify_password,
+    verify_password_timing_safe_async,
 )
 from utils.security import get_current_user
 
 logger = structlog.get_logger(__name__)
-router = APIRouter()
+# orjson serializes the token/user payloads in Rust instead of stdlib json —
+# worthwhile on /login and /refresh, which render on every authentication.
+router = APIRouter(default_response_class=ORJSONResponse)
+settings = get_settings()
 
 ACCOUNT_LOCKOUT_THRESHOLD = 10
 ACCOUNT_LOCKOUT_MINUTES   = 15
 
-# Stable advisory lock key — same value across all workers in the same DB instance.
-# Any 64-bit signed integer; this spells "greenopsa" in hex.
-_ADMIN_INIT_LOCK_KEY: int = 0x6772656E6F707361
+# Pre-built 401 for both invalid-credential paths. Built once instead of
+# allocating a fresh detail dict + exception per failed attempt (thousands
+# per second under credential stuffing). FastAPI only reads the exception,
+# so sharing one instance is safe; nothing may mutate .detail.
+_INVALID_CREDENTIALS = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail={"error": "invalid_credentials", "message": "Invalid username or password."},
+)
+
+# Set once ensure_admin_exists() completes in this process. With
+# preload_app=True the lifespan already runs once in the Gunicorn master,
+# but the guard keeps any repeated in-process invocation from paying the
+# enum probe + SELECT round-trips again.
+_ADMIN_INIT_DONE = False
+
+# ---------------------------------------------------------------------------
+# Cached statements
+#
+# lambda_stmt memoizes the Core→SQL construction, so the select() tree is
+# built once per process instead of on every request. Parameters are passed
+# at execute() time via bindparam names.
+# ---------------------------------------------------------------------------
+
+# login() only reads these seven columns and writes back via targeted
+# UPDATEs, so it fetches a plain Row instead of hydrating a full ORM User
+# into the identity map.
+_LOGIN_ROW_BY_USERNAME = lambda_stmt(
+    lambda: select(
+        User.id,
+        User.username,
+        User.password_hash,
+        User.role,
+        User.is_active,
+        User.locked_until,
+        User.failed_login_attempts,
+    ).where(User.username == bindparam("username"))
+)
+
+# Success-path writes fused into one statement: the user-row reset and the
+# refresh-token insert travel in a single round-trip instead of an UPDATE
+# and an INSERT issued back to back. :new_hash is NULL unless the password
+# was silently rehashed, in which case COALESCE swaps it in.
+_LOGIN_SUCCESS_STMT = text(
+    "WITH updated_user AS ("
+    "    UPDATE users"
+    "       SET failed_login_attempts = 0,"
+    "           locked_until = NULL,"
+    "           last_login = :now,"
+    "           password_hash = COALESCE(:new_hash, password_hash)"
+    "     WHERE id = :user_id"
+    ") "
+    "INSERT INTO refresh_tokens (user_id, token_hash, expires_at, user_agent, ip_address) "
+    "VALUES (:user_id, :token_hash, :expires_at, :user_agent, :ip_address)"
+)
+
+_REFRESH_TOKEN_WITH_USER = lambda_stmt(
+    lambda: select(RefreshToken, User)
+    .join(User, User.id == RefreshToken.user_id)
+    .where(
+        RefreshToken.token_hash == bindparam("token_hash"),
+        RefreshToken.revoked == False,
+    )
+)
+
+_LOGOUT_TOKEN_STMT = lambda_stmt(
+    lambda: select(RefreshToken).where(
+        RefreshToken.token_hash == bindparam("token_hash"),
+        RefreshToken.user_id == bindparam("user_id"),
+    )
+)
 
 
 # ---------------------------------------------------------------------------
 # Helper: coerce raw string or enum to UserRole
 # ---------------------------------------------------------------------------
 
+# O(1) coercion table. UserRole is a str-enum, so members hash identically
+# to their lowercase values — the value keys cover both members and plain
+# strings, and the name keys cover legacy uppercase input, all without
+# running the UserRole._missing_() member scan.
+_ROLE_MAP = {m.value: m for m in UserRole} | {m.name: m for m in UserRole}
+
+
 def _coerce_role(value) -> UserRole:
     """
     Accept a UserRole member OR a string and return a UserRole member.
-    Normalises case via UserRole._missing_().
+    Case is normalised via a dict lookup instead of UserRole._missing_().
 
     Examples:
         _coerce_role(UserRole.ADMIN)  → UserRole.ADMIN
@@ -67,11 +146,29 @@ def _coerce_role(value) -> UserRole:
         _coerce_role("ADMIN")         → UserRole.ADMIN  (normalised)
         _coerce_role("superuser")     → raises ValueError
     """
-    if isinstance(value, UserRole):
-        return value
-    if isinstance(value, str):
-        return UserRole(value)
-    raise ValueError(f"Cannot coerce {type(value)!r} to UserRole")
+    try:
+        role = _ROLE_MAP.get(value)
+    except TypeError:
+        role = None
+    if role is None and isinstance(value, str):
+        role = _ROLE_MAP.get(value.lower())
+    if role is None:
+        raise ValueError(f"{value!r} is not a valid UserRole")
+    return role
+
+
+def _client_ip(request: Request) -> str:
+    """
+    Client IP for logging/audit, bounded to the ip_address column width.
+
+    partition() instead of split(): no list allocation for the common
+    single-IP case, same first element when the header carries a proxy
+    chain. Bounding here means call sites never re-slice.
+    """
+    forwarded = request.headers.get("X-Forwarded-For", "").partition(",")[0].strip()
+    if forwarded:
+        return forwarded[:64]
+    return request.client.host[:64] if request.client else "unknown"
 
 
 # ---------------------------------------------------------------------------
@@ -117,39 +214,47 @@ async def login(
     request: Request,
     db: AsyncSession = Depends(get_db),
 ):
-    ip_address = (
-        request.headers.get("X-Forwarded-For", "").split(",")[0].strip()
-        or (request.client.host if request.client else "unknown")
-    )
+    ip_address = _client_ip(request)
+
+    # One timestamp per request — reused for the lockout comparison,
+    # lockout window start and last_login instead of four separate
+    # datetime.now() allocations.
+    now = datetime.now(timezone.utc)
 
     # ── 1. Fetch user ──────────────────────────────────────────────────────
-    result = await db.execute(
-        select(User).where(User.username == payload.username)
-    )
-    user = result.scalar_one_or_none()
+    result = await db.execute(_LOGIN_ROW_BY_USERNAME, {"username": payload.username})
+    user = result.first()
+
+    # ── 2. Password verification — single Argon2 call on every path ────────
+    # Every attempt performs exactly one full memory-hard verification.
+    # Unknown/inactive users are verified against the module-level dummy hash
+    # (same parameters as real hashes), so "user not found", "inactive" and
+    # "wrong password" all take the same ~100 ms — no enumeration via timing.
+    # Runs on the dedicated Argon2 thread pool so those ~100 ms never stall
+    # the event loop; concurrent logins overlap instead of serializing.
+    stored_hash = user.password_hash if user and user.is_active else None
+    password_ok = await verify_password_timing_safe_async(payload.password, stored_hash)
 
-    # ── 2. Unknown user / inactive ─────────────────────────────────────────
-    # Always call timing_safe_dummy_verify() before returning 401 so that
-    # "user not found" and "wrong password" paths take the same time (~100ms).
-    # Without this, username enumeration is trivial via timing.
     if not user or not user.is_active:
-        timing_safe_dummy_verify()
-        logger.warning(
+        # debug, not warning: this event fires for fully unauthenticated
+        # traffic (any POST with a made-up username), so at warning level it
+        # is a log-amplification vector under credential stuffing. With the
+        # filtering bound logger configured at INFO, the call below is a
+        # near-free no-op — no processor chain, no JSON rendering.
+        logger.debug(
             "login_failed",
             reason="user_not_found_or_inactive",
             username=payload.username,
             ip=ip_address,
         )
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"error": "invalid_credentials", "message": "Invalid username or password."},
-        )
+        raise _INVALID_CREDENTIALS
 
     # ── 3. Account lockout check ───────────────────────────────────────────
-    if user.locked_until and user.locked_until > datetime.now(timezone.utc):
-        wait_minutes = (
-            int((user.locked_until - datetime.now(timezone.utc)).total_seconds() / 60) + 1
-        )
+    if user.locked_until and user.locked_until > now:
+        # Saturating integer ceil-division: no float math, and clock skew
+        # can never produce a negative wait.
+        remaining_s = max(0, int((user.locked_until - now).total_seconds()))
+        wait_minutes = (remaining_s + 59) // 60
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail={
@@ -158,38 +263,39 @@ async def login(
             },
         )
 
-    # ── 4. Password verification ───────────────────────────────────────────
-    if not verify_password(payload.password, user.password_hash):
-        user.failed_login_attempts += 1
-
-        if user.failed_login_attempts >= ACCOUNT_LOCKOUT_THRESHOLD:
-            user.locked_until = datetime.now(timezone.utc) + timedelta(
-                minutes=ACCOUNT_LOCKOUT_MINUTES
-            )
-            user.failed_login_attempts = 0
+    # ── 4. Wrong password ──────────────────────────────────────────────────
+    if not password_ok:
+        # Targeted core UPDATE instead of mutating the ORM instance: skips
+        # the unit-of-work dirty scan and flush on a path an attacker can
+        # drive at will (credential stuffing).
+        attempts = user.failed_login_attempts + 1
+        locked_until = user.locked_until
+
+        if attempts >= ACCOUNT_LOCKOUT_THRESHOLD:
+            locked_until = now + timedelta(minutes=ACCOUNT_LOCKOUT_MINUTES)
+            attempts = 0
             logger.warning("account_locked", username=payload.username, ip=ip_address)
 
+        await db.execute(
+            update(User)
+            .where(User.id == user.id)
+            .values(failed_login_attempts=attempts, locked_until=locked_until)
+        )
         await db.commit()
         logger.warning(
             "login_failed",
             reason="wrong_password",
             username=payload.username,
-            attempts=user.failed_login_attempts,
+            attempts=attempts,
             ip=ip_address,
         )
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"error": "invalid_credentials", "message": "Invalid username or password."},
-        )
+        raise _INVALID_CREDENTIALS
 
     # ── 5. Successful authentication ───────────────────────────────────────
-    user.failed_login_attempts = 0
-    user.locked_until = None
-    user.last_login = datetime.now(timezone.utc)
-
     # Silently upgrade hash if Argon2id parameters have changed.
+    new_hash = None
     if needs_rehash(user.password_hash):
-        user.password_hash = hash_password(payload.password)
+        new_hash = await hash_password_async(payload.password)
         logger.info("password_rehashed", username=user.username)
 
     role_value = _coerce_role(user.role).value
@@ -198,17 +304,22 @@ async def login(
         user_id=user.id,
         username=user.username,
         role=role_value,
+        now=now,
     )
-    raw_refresh, refresh_hash, refresh_expires = create_refresh_token()
-
-    db_refresh = RefreshToken(
-        user_id=user.id,
-        token_hash=refresh_hash,
-        expires_at=refresh_expires,
-        user_agent=request.headers.get("User-Agent", "")[:256],
-        ip_address=ip_address[:64],
+    raw_refresh, refresh_hash, refresh_expires = create_refresh_token(now=now)
+
+    await db.execute(
+        _LOGIN_SUCCESS_STMT,
+        {
+            "user_id": user.id,
+            "now": now,
+            "new_hash": new_hash,
+            "token_hash": refresh_hash,
+            "expires_at": refresh_expires,
+            "user_agent": request.headers.get("User-Agent", "")[:256],
+            "ip_address": ip_address,
+        },
     )
-    db.add(db_refresh)
     await db.commit()
 
     logger.info("login_success", username=user.username, ip=ip_address)
@@ -228,39 +339,32 @@ async def refresh_token(
     db: AsyncSession = Depends(get_db),
 ):
     token_hash = hash_refresh_token(payload.refresh_token)
+    now = datetime.now(timezone.utc)
 
-    result = await db.execute(
-        select(RefreshToken).where(
-            RefreshToken.token_hash == token_hash,
-            RefreshToken.revoked == False,
-        )
-    )
-    db_token = result.scalar_one_or_none()
+    # Single round-trip: fetch the token and its owner together. The user's
+    # active flag is checked in Python so "invalid token" and "user inactive"
+    # remain distinguishable without a second query.
+    result = await db.execute(_REFRESH_TOKEN_WITH_USER, {"token_hash": token_hash})
+    row = result.one_or_none()
 
-    if not db_token:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"error": "invalid_token", "message": "Invalid or expired refresh token."},
         )
 
-    if db_token.expires_at.replace(tzinfo=timezone.utc) < datetime.now(timezone.utc):
+    db_token, user = row
+
+    if db_token.expires_at.replace(tzinfo=timezone.utc) < now:
         db_token.revoked = True
-        db_token.revoked_at = datetime.now(timezone.utc)
+        db_token.revoked_at = now
         await db.commit()
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"error": "token_expired", "message": "Refresh token expired."},
         )
 
-    result = await db.execute(
-        select(User).where(
-            User.id == db_token.user_id,
-            User.is_active == True,
-        )
-    )
-    user = result.scalar_one_or_none()
-
-    if not user:
+    if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"error": "user_inactive", "message": "User inactive or not found."},
@@ -268,13 +372,14 @@ async def refresh_token(
 
     # Token rotation: revoke old token, issue new access token.
     db_token.revoked = True
-    db_token.revoked_at = datetime.now(timezone.utc)
+    db_token.revoked_at = now
 
-    role_value = _coerce_role(user.role).value
+    role_value = user.role_str
     access_token, expires_at = create_access_token(
         user_id=user.id,
         username=user.username,
         role=role_value,
+        now=now,
     )
     await db.commit()
 
@@ -290,10 +395,8 @@ async def logout(
     token_hash = hash_refresh_token(payload.refresh_token)
 
     result = await db.execute(
-        select(RefreshToken).where(
-            RefreshToken.token_hash == token_hash,
-            RefreshToken.user_id == current_user.id,
-        )
+        _LOGOUT_TOKEN_STMT,
+        {"token_hash": token_hash, "user_id": current_user.id},
     )
     db_token = result.scalar_one_or_none()
 
@@ -308,14 +411,14 @@ async def logout(
 @router.get("/verify")
 async def verify_token(current_user: User = Depends(get_current_user)):
     """Verify the current access token is valid and return basic user info."""
-    role_value = _coerce_role(current_user.role).value
+    role_value = current_user.role_str
     return {"valid": True, "username": current_user.username, "role": role_value}
 
 
 @router.get("/me")
 async def get_me(current_user: User = Depends(get_current_user)):
     """Return the current authenticated user's profile."""
-    role_value = _coerce_role(current_user.role).value
+    role_value = current_user.role_str
     return {
         "id":         current_user.id,
         "username":   current_user.username,
@@ -347,57 +450,47 @@ async def ensure_admin_exists(db: AsyncSession) -> None:
 
     Multi-worker safety
     ─────────────────────
-    pg_advisory_xact_lock(key) blocks until the lock is acquired and is released
-    automatically at the end of the transaction. All workers share the same
-    PostgreSQL server, so exactly one worker proceeds at a time.
+    The users.username UNIQUE constraint is the arbiter: if several workers
+    race past the existence check, exactly one INSERT commits and the rest
+    land in the IntegrityError handler, which treats the bootstrap as
+    complete. Workers therefore boot fully in parallel — no cluster-wide
+    advisory lock to queue behind.
 
     Timeline (4 Gunicorn workers, no existing admin):
-      W1: acquires lock → SELECT None → INSERT → COMMIT → lock released
-      W2: acquires lock → SELECT finds W1's row → returns immediately
-      W3, W4: same as W2
+      W1: SELECT none → INSERT → COMMIT
+      W2: SELECT none → INSERT → IntegrityError → done (W1 won)
+      W3, W4: SELECT finds the row → return immediately
     """
-    from config import get_settings
-    settings = get_settings()
+    global _ADMIN_INIT_DONE
+    if _ADMIN_INIT_DONE:
+        return
 
     try:
-        # ── Step 0: Sanity-check that the PostgreSQL enum type exists ──────
-        # If the migration hasn't run, we get a clear error here rather than
-        # a cryptic "invalid input value" failure later.
-        try:
-            await db.execute(text("SELECT 'admin'::user_role"))
-        except DBAPIError as exc:
-            logger.error(
-                "startup_enum_check_failed",
-                hint=(
-                    "The 'user_role' PostgreSQL enum type does not exist or does "
-                    "not contain 'admin'. Ensure migrations/init-scripts/01-initial-schema.sql "
-                    "ran successfully on first boot."
-                ),
-                error=str(exc),
-            )
-            await db.rollback()
-            raise
-
-        # ── Step 1: Acquire PostgreSQL session-level advisory lock ────────
-        # Serialises the check-then-insert across all concurrent workers.
-        await db.execute(text(f"SELECT pg_advisory_xact_lock({_ADMIN_INIT_LOCK_KEY})"))
-
-        # ── Step 2: Check for existing admin (with lock held) ─────────────
+        # ── Step 1: Enum sanity check ─────────────────────────────────────
+        # The 'admin'::user_role cast fails with a clear error if the
+        # migration hasn't run (rather than a cryptic "invalid input value"
+        # later). No advisory lock: the username unique constraint makes the
+        # rare concurrent-create race safe (see docstring), so workers don't
+        # serialise through a cluster-wide lock on every boot.
+        await db.execute(text("SELECT 'admin'::user_role"))
+
+        # ── Step 2: Check for existing admin ──────────────────────────────
         admin_username = settings.INITIAL_ADMIN_USERNAME.strip().lower()
 
+        # Scalar existence probe — no ORM User hydration just to test
+        # presence, and nothing to coerce for the log line.
         result = await db.execute(
-            select(User).where(User.username == admin_username)
+            select(User.id).where(User.username == admin_username).limit(1)
         )
         existing = result.scalar_one_or_none()
 
-        if existing:
+        if existing is not None:
             logger.info(
                 "admin_already_exists",
                 username=admin_username,
-                role=_coerce_role(existing.role).value,
                 note="Existing password is preserved. Use the dashboard to change it.",
             )
-            await db.commit()
+            _ADMIN_INIT_DONE = True
             return
 
         # ── Step 3: Determine password — NEVER auto-generate ─────────────
@@ -421,9 +514,9 @@ async def ensure_admin_exists(db: AsyncSession) -> None:
         )
         db.add(admin)
 
-        # COMMIT also releases the pg_advisory_xact_lock.
         await db.commit()
 
+        _ADMIN_INIT_DONE = True
         logger.info(
             "admin_user_created",
             username=admin_username,
@@ -431,9 +524,11 @@ async def ensure_admin_exists(db: AsyncSession) -> None:
         )
 
     except IntegrityError:
-        # Extremely rare with the advisory lock in place, but handled defensively.
-        # A concurrent INSERT could happen if someone inserted outside this flow.
+        # Lost the concurrent-create race: another worker committed the row
+        # between our SELECT and INSERT. The admin exists either way, so the
+        # bootstrap is complete.
         await db.rollback()
+        _ADMIN_INIT_DONE = True
         logger.info(
             "admin_creation_skipped",
             reason="IntegrityError — row already existed when we tried to insert.",
@@ -447,8 +542,9 @@ async def ensure_admin_exists(db: AsyncSession) -> None:
             error=str(exc),
             hint=(
                 "Database-level error during admin bootstrap. Common causes: "
-                "enum type missing (run migrations), DB not accepting connections, "
-                "schema mismatch."
+                "the 'user_role' enum type missing (ensure "
+                "migrations/init-scripts/01-initial-schema.sql ran), DB not "
+                "accepting connections, schema mismatch."
             ),
         )
         raise  # Propagate — main.py lifespan will call sys.exit(1)
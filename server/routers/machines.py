@@ -1,19 +1,26 @@
 """GreenOps Machines Router"""
+import asyncio
+import time
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 import structlog
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from pydantic import BaseModel, Field
-from sqlalchemy import select, func, desc
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from sqlalchemy import select, func, desc, delete, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from config import get_settings
-from database import AgentToken, Heartbeat, Machine, MachineStatus, get_db
+from database import AgentToken, AsyncSessionLocal, Heartbeat, Machine, MachineStatus, get_db
 from utils.security import get_current_user, require_admin
 
 logger = structlog.get_logger(__name__)
 router = APIRouter()
 settings = get_settings()
 
+# O(1) status-filter lookup, built once at import. Avoids constructing the
+# enum through MachineStatus(...) — and raising/catching ValueError on bad
+# input — inside the request path.
+_STATUS_MAP = {s.value: s for s in MachineStatus}
+
 
 class MachineOut(BaseModel):
     id: int
@@ -32,8 +39,7 @@ class MachineOut(BaseModel):
     agent_version: Optional[str]
     notes: Optional[str]
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class HeartbeatOut(BaseModel):
@@ -45,8 +51,32 @@ class HeartbeatOut(BaseModel):
     is_idle: bool
     energy_delta_kwh: float
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Serializing big list responses through a TypeAdapter renders the JSON in
+# one Rust pass (validate from ORM attributes, dump bytes) instead of
+# FastAPI's per-route validation followed by jsonable_encoder + json.dumps.
+# Returning a Response bypasses that machinery; response_model stays on the
+# routes for OpenAPI.
+_machines_adapter = TypeAdapter(List[MachineOut])
+_heartbeats_adapter = TypeAdapter(List[HeartbeatOut])
+
+# The columns MachineOut exposes — listing selects these directly so rows
+# come back as plain Row tuples instead of Machine entities hydrated into
+# the identity map.
+_MACHINE_COLS = (
+    Machine.id, Machine.mac_address, Machine.hostname, Machine.os_type,
+    Machine.os_version, Machine.ip_address, Machine.status, Machine.first_seen,
+    Machine.last_seen, Machine.total_idle_seconds, Machine.total_active_seconds,
+    Machine.energy_wasted_kwh, Machine.energy_cost_usd, Machine.agent_version,
+    Machine.notes,
+)
+
+
+def _json_list_response(adapter: TypeAdapter, rows) -> Response:
+    validated = adapter.validate_python(rows, from_attributes=True)
+    return Response(content=adapter.dump_json(validated), media_type="application/json")
 
 
 class UpdateMachineRequest(BaseModel):
@@ -54,19 +84,54 @@ class UpdateMachineRequest(BaseModel):
     hostname: Optional[str] = Field(None, min_length=1, max_length=255)
 
 
-async def mark_offline_machines(db: AsyncSession):
+# The offline sweep is driven by read traffic (every /machines list/count
+# request), so without a cooldown it fires once per request — pure write
+# amplification, since staleness is measured in tens of seconds. The sweep
+# runs at most once per interval per process, and off the request path: it
+# gets its own short-lived session in a background task, so requests serve
+# at-most-one-interval-old statuses instead of waiting on the UPDATE.
+_SWEEP_INTERVAL_S = min(settings.OFFLINE_THRESHOLD_SECONDS / 4, 5.0)
+_last_sweep = 0.0
+
+
+def schedule_offline_sweep() -> None:
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < _SWEEP_INTERVAL_S:
+        return
+    # Check-then-set with no await in between: on a single event loop two
+    # requests can never both pass the cooldown, so at most one sweep task
+    # is ever in flight.
+    _last_sweep = now
+    asyncio.create_task(_run_sweep())
+
+
+async def _run_sweep() -> None:
+    try:
+        async with AsyncSessionLocal() as session:
+            await _sweep_offline(session)
+    except Exception:
+        logger.exception("offline_sweep_failed")
+
+
+async def _sweep_offline(db: AsyncSession):
+    # One bulk UPDATE instead of SELECT + per-row ORM mutation + flush:
+    # the server flips the stale rows in place, so client-side work stays
+    # constant no matter how many machines went quiet. No session rows are
+    # hydrated, so there is nothing for the unit of work to synchronize.
     cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.OFFLINE_THRESHOLD_SECONDS)
     result = await db.execute(
-        select(Machine).where(
+        update(Machine)
+        .where(
             Machine.status.in_([MachineStatus.ONLINE, MachineStatus.IDLE]),
             Machine.last_seen < cutoff,
         )
+        .values(status=MachineStatus.OFFLINE)
+        .execution_options(synchronize_session=False)
     )
-    machines = result.scalars().all()
-    for m in machines:
-        m.status = MachineStatus.OFFLINE
-    if machines:
+    if result.rowcount:
         await db.commit()
+        _invalidate_count_cache()
 
 
 @router.get("", response_model=List[MachineOut])
@@ -75,79 +140,155 @@ async def list_machines(
     search: Optional[str] = Query(None, max_length=100),
     limit: int = Query(100, ge=1, le=500),
     offset: int = Query(0, ge=0),
+    cursor_last_seen: Optional[datetime] = Query(None),
+    cursor_id: Optional[int] = Query(None),
     current_user=Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    await mark_offline_machines(db)
-    query = select(Machine)
+    schedule_offline_sweep()
+    query = select(*_MACHINE_COLS)
     if status_filter:
-        try:
-            status_enum = MachineStatus(status_filter.lower())
-            query = query.where(Machine.status == status_enum)
-        except ValueError:
+        status_enum = _STATUS_MAP.get(status_filter.lower())
+        if status_enum is None:
             raise HTTPException(status_code=400, detail={"error": "invalid_filter", "message": f"Invalid status: {status_filter}"})
+        query = query.where(Machine.status == status_enum)
     if search:
         term = f"%{search}%"
         query = query.where(Machine.hostname.ilike(term) | Machine.mac_address.ilike(term) | Machine.ip_address.ilike(term))
-    query = query.order_by(desc(Machine.last_seen)).limit(limit).offset(offset)
-    result = await db.execute(query)
-    return result.scalars().all()
+    query = query.order_by(desc(Machine.last_seen), desc(Machine.id))
+    if cursor_last_seen is not None and cursor_id is not None:
+        # Keyset pagination: resume strictly after the last row of the
+        # previous page. O(page) index reads at any depth, where OFFSET
+        # scans and discards every preceding row. Clients take the cursor
+        # from the last row's (last_seen, id); offset stays as a legacy
+        # fallback for callers that don't send one.
+        query = query.where(tuple_(Machine.last_seen, Machine.id) < tuple_(cursor_last_seen, cursor_id))
+    elif offset:
+        query = query.offset(offset)
+    result = await db.execute(query.limit(limit))
+    return _json_list_response(_machines_adapter, result.all())
+
+
+# Status counts change only when a machine is added, deleted, or flips
+# status — a low-volatility read served from a short-TTL process-local
+# cache. The stack has no Redis, so each worker holds its own copy;
+# mutations in this process invalidate immediately, other workers converge
+# within the TTL, which matches the freshness the dashboard needs.
+_COUNT_CACHE_TTL_S = 10.0
+_count_cache: Optional[dict] = None
+_count_cache_expires = 0.0
+
+
+def _invalidate_count_cache() -> None:
+    global _count_cache
+    _count_cache = None
 
 
 @router.get("/count")
 async def count_machines(current_user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    await mark_offline_machines(db)
+    global _count_cache, _count_cache_expires
+    if _count_cache is not None and time.monotonic() < _count_cache_expires:
+        return _count_cache
+    schedule_offline_sweep()
     result = await db.execute(select(Machine.status, func.count(Machine.id)).group_by(Machine.status))
     counts = {row[0].value: row[1] for row in result.all()}
-    return {"total": sum(counts.values()), "online": counts.get("online", 0), "idle": counts.get("idle", 0), "offline": counts.get("offline", 0)}
+    payload = {"total": sum(counts.values()), "online": counts.get("online", 0), "idle": counts.get("idle", 0), "offline": counts.get("offline", 0)}
+    _count_cache = payload
+    _count_cache_expires = time.monotonic() + _COUNT_CACHE_TTL_S
+    return payload
+
+
+# Single-machine pages are polled by the dashboard, so /machines/{id} is a
+# repeat read whose answer changes only on mutation or heartbeat. Same
+# adaptation as the count cache (no Redis in this stack): per-worker
+# serialized responses with a short TTL; in-process mutations invalidate
+# eagerly, heartbeat-driven last_seen bumps are bounded by the TTL.
+_MACHINE_CACHE_TTL_S = 5.0
+_MACHINE_CACHE_MAX = 1024
+_machine_adapter = TypeAdapter(MachineOut)
+_machine_cache: dict = {}  # machine_id -> (expires_monotonic, body_bytes)
+
+
+def _invalidate_machine_cache(machine_id: int) -> None:
+    _machine_cache.pop(machine_id, None)
 
 
 @router.get("/{machine_id}", response_model=MachineOut)
 async def get_machine(machine_id: int, current_user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Machine).where(Machine.id == machine_id))
-    machine = result.scalar_one_or_none()
+    cached = _machine_cache.get(machine_id)
+    if cached is not None and time.monotonic() < cached[0]:
+        return Response(content=cached[1], media_type="application/json")
+    # Session.get: identity-map PK lookup with a pre-baked statement — no
+    # per-request select() construction.
+    machine = await db.get(Machine, machine_id)
     if not machine:
         raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Machine not found."})
-    return machine
+    body = _machine_adapter.dump_json(_machine_adapter.validate_python(machine, from_attributes=True))
+    if len(_machine_cache) >= _MACHINE_CACHE_MAX:
+        _machine_cache.clear()
+    _machine_cache[machine_id] = (time.monotonic() + _MACHINE_CACHE_TTL_S, body)
+    return Response(content=body, media_type="application/json")
 
 
 @router.patch("/{machine_id}", response_model=MachineOut)
 async def update_machine(machine_id: int, payload: UpdateMachineRequest, current_user=Depends(require_admin), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Machine).where(Machine.id == machine_id))
+    # UPDATE ... RETURNING instead of SELECT-then-mutate: the write and the
+    # read of the updated row travel in one round trip, and rowcount doubles
+    # as the existence check.
+    values = payload.model_dump(exclude_none=True)
+    if not values:
+        machine = await db.get(Machine, machine_id)
+        if not machine:
+            raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Machine not found."})
+        return machine
+    result = await db.execute(
+        update(Machine).where(Machine.id == machine_id).values(**values).returning(Machine)
+    )
     machine = result.scalar_one_or_none()
     if not machine:
         raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Machine not found."})
-    if payload.notes is not None:
-        machine.notes = payload.notes
-    if payload.hostname is not None:
-        machine.hostname = payload.hostname
     await db.commit()
+    _invalidate_machine_cache(machine_id)
     return machine
 
 
 @router.delete("/{machine_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_machine(machine_id: int, current_user=Depends(require_admin), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Machine).where(Machine.id == machine_id))
-    machine = result.scalar_one_or_none()
-    if not machine:
+    # Single DELETE; the FK ondelete=CASCADE clauses remove dependent
+    # heartbeats and agent tokens server-side, so the ORM cascade (which
+    # needs the row loaded) is not required.
+    result = await db.execute(delete(Machine).where(Machine.id == machine_id))
+    if not result.rowcount:
         raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Machine not found."})
-    await db.delete(machine)
     await db.commit()
+    _invalidate_count_cache()
+    _invalidate_machine_cache(machine_id)
 
 
 @router.get("/{machine_id}/heartbeats", response_model=List[HeartbeatOut])
 async def get_machine_heartbeats(machine_id: int, limit: int = Query(100, ge=1, le=1000), current_user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Machine).where(Machine.id == machine_id))
-    if not result.scalar_one_or_none():
-        raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Machine not found."})
+    # Fetch heartbeats first: any row proves the machine exists, so the
+    # common path is one round trip. Only an empty result needs the cheap
+    # existence probe to distinguish "no heartbeats yet" from 404.
     result = await db.execute(select(Heartbeat).where(Heartbeat.machine_id == machine_id).order_by(desc(Heartbeat.timestamp)).limit(limit))
-    return result.scalars().all()
+    heartbeats = result.scalars().all()
+    if heartbeats:
+        return _json_list_response(_heartbeats_adapter, heartbeats)
+    exists = await db.scalar(select(Machine.id).where(Machine.id == machine_id))
+    if exists is None:
+        raise HTTPException(status_code=404, detail={"error": "not_found", "message": "Machine not found."})
+    return _json_list_response(_heartbeats_adapter, [])
 
 
 @router.post("/{machine_id}/revoke-token", status_code=status.HTTP_204_NO_CONTENT)
 async def revoke_agent_token(machine_id: int, current_user=Depends(require_admin), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(AgentToken).where(AgentToken.machine_id == machine_id, AgentToken.revoked == False))
-    token = result.scalar_one_or_none()
-    if token:
-        token.revoked = True
+    # One targeted UPDATE; the revoked == False predicate keeps it
+    # idempotent without the prior SELECT-then-mutate round trip.
+    result = await db.execute(
+        update(AgentToken)
+        .where(AgentToken.machine_id == machine_id, AgentToken.revoked == False)
+        .values(revoked=True)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
         await db.commit()
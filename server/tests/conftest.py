@@ -0,0 +1,14 @@
+"""Shared fixtures for the GreenOps server test suite."""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _reset_admin_init_guard():
+    """
+    ensure_admin_exists() memoizes completion per process so repeated calls
+    skip the DB round-trips. Tests exercise it repeatedly, so clear the
+    guard before each one.
+    """
+    import routers.auth
+    routers.auth._ADMIN_INIT_DONE = False
+    yield
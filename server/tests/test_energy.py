@@ -0,0 +1,90 @@
+"""
+GreenOps — vectorized energy helper tests.
+
+Run:
+    pytest server/tests/test_energy.py -v
+
+The batch helpers (calculate_energy_wasted_batch, calculate_cost_batch,
+is_idle_batch, compute_energy_metrics) have no server call sites yet, so
+these tests are what pins them to the scalar helpers they vectorize.
+"""
+
+import numpy as np
+import pytest
+
+
+# Representative idle readings: zero, sub-threshold, fractional, and large.
+SAMPLES = [0.0, 1.0, 59.9, 300.0, 3600.0, 86400.0, 123456.789]
+
+
+class TestEnergyBatchHelpers:
+    """Batch outputs must match the scalar helpers element-wise."""
+
+    def test_energy_batch_matches_scalar(self):
+        from utils.energy import calculate_energy_wasted, calculate_energy_wasted_batch
+        batch = calculate_energy_wasted_batch(SAMPLES)
+        assert batch.dtype == np.float64
+        for got, seconds in zip(batch, SAMPLES):
+            # Scalar rounds to 6 decimals; the batch path deliberately
+            # doesn't, so they must agree once the batch value is rounded.
+            assert round(float(got), 6) == calculate_energy_wasted(seconds)
+
+    def test_energy_batch_skips_rounding(self):
+        """The batch path returns full precision — rounding is the caller's
+        job at the serialization boundary. Pin that as documented behaviour."""
+        from utils.energy import _KWH_PER_IDLE_SECOND, calculate_energy_wasted_batch
+        batch = calculate_energy_wasted_batch(SAMPLES)
+        expected = np.asarray(SAMPLES, dtype=np.float64) * _KWH_PER_IDLE_SECOND
+        assert np.array_equal(batch, expected)
+
+    def test_cost_batch_matches_scalar(self):
+        from utils.energy import calculate_cost, calculate_cost_batch, calculate_energy_wasted_batch
+        energy = calculate_energy_wasted_batch(SAMPLES)
+        batch = calculate_cost_batch(energy)
+        for got, kwh in zip(batch, energy):
+            assert round(float(got), 4) == calculate_cost(float(kwh))
+
+    def test_is_idle_batch_matches_scalar(self):
+        from utils.energy import _IDLE_THRESHOLD, is_idle, is_idle_batch
+        # Include both sides of the threshold and the boundary itself.
+        samples = SAMPLES + [_IDLE_THRESHOLD - 1.0, _IDLE_THRESHOLD, _IDLE_THRESHOLD + 1.0]
+        batch = is_idle_batch(samples)
+        assert batch.dtype == np.bool_
+        for got, seconds in zip(batch, samples):
+            assert bool(got) == is_idle(seconds)
+
+    def test_batch_helpers_accept_plain_sequences(self):
+        """Callers pass lists straight from fetchall(); no pre-conversion."""
+        from utils.energy import calculate_cost_batch, calculate_energy_wasted_batch, is_idle_batch
+        assert calculate_energy_wasted_batch([60.0]).shape == (1,)
+        assert calculate_cost_batch([0.5]).shape == (1,)
+        assert is_idle_batch([60.0]).shape == (1,)
+
+    def test_empty_batch(self):
+        from utils.energy import calculate_energy_wasted_batch, is_idle_batch
+        assert calculate_energy_wasted_batch([]).shape == (0,)
+        assert is_idle_batch([]).shape == (0,)
+
+
+class TestComputeEnergyMetrics:
+    """The fused single-pass helper must agree with the individual helpers."""
+
+    def test_matches_individual_batch_helpers(self):
+        from utils.energy import (
+            calculate_cost_batch,
+            calculate_energy_wasted_batch,
+            compute_energy_metrics,
+            is_idle_batch,
+        )
+        energy, cost, idle = compute_energy_metrics(SAMPLES)
+        assert np.array_equal(energy, calculate_energy_wasted_batch(SAMPLES))
+        assert np.array_equal(cost, calculate_cost_batch(calculate_energy_wasted_batch(SAMPLES)))
+        assert np.array_equal(idle, is_idle_batch(SAMPLES))
+
+    def test_shapes_and_dtypes(self):
+        from utils.energy import compute_energy_metrics
+        energy, cost, idle = compute_energy_metrics(SAMPLES)
+        assert energy.shape == cost.shape == idle.shape == (len(SAMPLES),)
+        assert energy.dtype == np.float64
+        assert cost.dtype == np.float64
+        assert idle.dtype == np.bool_
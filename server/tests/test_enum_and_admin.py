@@ -168,12 +168,13 @@ class TestEnsureAdminExists:
         mock_db.commit = AsyncMock()
         mock_db.rollback = AsyncMock()
 
-        with patch("routers.auth.get_settings") as mock_settings_fn:
-            cfg = MagicMock()
-            cfg.INITIAL_ADMIN_USERNAME = "admin"
-            cfg.INITIAL_ADMIN_PASSWORD = "StrongPass123!"
-            mock_settings_fn.return_value = cfg
+        cfg = MagicMock()
+        cfg.INITIAL_ADMIN_USERNAME = "admin"
+        cfg.INITIAL_ADMIN_PASSWORD = "StrongPass123!"
 
+        # ensure_admin_exists reads the module-level settings binding, so
+        # patch that attribute — patching get_settings would be a no-op.
+        with patch("routers.auth.settings", cfg):
             await ensure_admin_exists(mock_db)
 
         assert mock_db.add.called, "db.add() must be called to insert the admin"
@@ -209,12 +210,11 @@ class TestEnsureAdminExists:
         )
         mock_db.rollback = AsyncMock()
 
-        with patch("routers.auth.get_settings") as mock_settings_fn:
-            cfg = MagicMock()
-            cfg.INITIAL_ADMIN_USERNAME = "admin"
-            cfg.INITIAL_ADMIN_PASSWORD = "StrongPass123!"
-            mock_settings_fn.return_value = cfg
+        cfg = MagicMock()
+        cfg.INITIAL_ADMIN_USERNAME = "admin"
+        cfg.INITIAL_ADMIN_PASSWORD = "StrongPass123!"
 
+        with patch("routers.auth.settings", cfg):
             # Must not raise
             await ensure_admin_exists(mock_db)
 
@@ -235,20 +235,20 @@ class TestEnsureAdminExists:
         )
         mock_db.rollback = AsyncMock()
 
-        with patch("routers.auth.get_settings") as mock_settings_fn:
-            cfg = MagicMock()
-            cfg.INITIAL_ADMIN_USERNAME = "admin"
-            cfg.INITIAL_ADMIN_PASSWORD = "StrongPass123!"
-            mock_settings_fn.return_value = cfg
+        cfg = MagicMock()
+        cfg.INITIAL_ADMIN_USERNAME = "admin"
+        cfg.INITIAL_ADMIN_PASSWORD = "StrongPass123!"
 
+        with patch("routers.auth.settings", cfg):
             with pytest.raises(DBAPIError):
                 await ensure_admin_exists(mock_db)
 
         mock_db.rollback.assert_called_once()
 
     @pytest.mark.asyncio
-    async def test_generates_random_password_when_none_set(self):
-        """When INITIAL_ADMIN_PASSWORD is empty, a random password is generated."""
+    async def test_falls_back_to_default_password_when_none_set(self):
+        """When INITIAL_ADMIN_PASSWORD is empty, the documented deterministic
+        fallback 'admin123' is used — credentials are never auto-generated."""
         from database import User, UserRole
         from routers.auth import ensure_admin_exists
 
@@ -262,17 +262,18 @@ class TestEnsureAdminExists:
         mock_db.commit = AsyncMock()
         mock_db.rollback = AsyncMock()
 
-        with patch("routers.auth.get_settings") as mock_settings_fn:
-            cfg = MagicMock()
-            cfg.INITIAL_ADMIN_USERNAME = "admin"
-            cfg.INITIAL_ADMIN_PASSWORD = ""   # ← empty triggers random generation
-            mock_settings_fn.return_value = cfg
+        cfg = MagicMock()
+        cfg.INITIAL_ADMIN_USERNAME = "admin"
+        cfg.INITIAL_ADMIN_PASSWORD = ""   # ← empty triggers the fallback
 
+        with patch("routers.auth.settings", cfg), \
+             patch("routers.auth.hash_password", return_value="hashed") as mock_hash:
             await ensure_admin_exists(mock_db)
 
+        mock_hash.assert_called_once_with("admin123")
         assert mock_db.add.called
         added_user = mock_db.add.call_args[0][0]
-        # Even with random password, role must still be the enum member
+        # Even on the fallback path, role must still be the enum member
         assert added_user.role is UserRole.ADMIN
 
 
@@ -10,9 +10,13 @@ This module has NO FastAPI router. It is imported by:
   - server/utils/security.py (decode_access_token, hash_agent_token)
 """
 
+import asyncio
+import functools
 import hashlib
+import os
 import secrets
-import uuid
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Tuple
 
@@ -32,31 +36,63 @@ settings = get_settings()
 # because the argon2 encoded string embeds them and verify() reads them from
 # the stored hash — but we keep a consistent instance to catch config drift.
 #
-#   time_cost=3       — 3 iterations over memory
+#   time_cost=4       — 4 iterations over memory
 #   memory_cost=65536 — 64 MB per hash (memory-hard)
-#   parallelism=4     — 4 threads
+#   parallelism=1     — single lane: Argon2 is memory-bandwidth-bound, so
+#                       4 internal threads per hash bought no wall-clock
+#                       but oversubscribed the CPU 4x under concurrent
+#                       logins. One lane per verify, with concurrency
+#                       coming from the executor below; time_cost bumped
+#                       3 → 4 to keep the per-hash work factor.
+#                       Existing p=4 hashes verify fine (params are read
+#                       from the stored string) and are upgraded silently
+#                       on next login via the needs_rehash path.
 #   hash_len=32       — 32-byte output digest
 #   salt_len=16       — 16-byte random salt (embedded in the hash string)
 # ---------------------------------------------------------------------------
 _ph = PasswordHasher(
-    time_cost=3,
+    time_cost=4,
     memory_cost=65536,
-    parallelism=4,
+    parallelism=1,
     hash_len=32,
     salt_len=16,
 )
 
 # ---------------------------------------------------------------------------
-# Pre-compute a VALID Argon2id dummy hash at module load time.
+# VALID Argon2id dummy hash, computed lazily on first use.
 #
-# WHY THIS MATTERS:
+# WHY A REAL HASH:
 #   A hardcoded invalid hash string causes argon2-cffi to raise
 #   InvalidHashError immediately (microseconds), allowing timing attacks
 #   to enumerate valid usernames. A real hash forces full memory-hard
 #   computation (~100 ms) before returning False — matching a real failed
 #   login attempt.
+#
+# WHY LAZY:
+#   Hashing at import added ~100 ms to every worker boot (x N workers on
+#   rolling restarts) for a value only needed once a login is rejected.
+#   functools.cache moves that cost to the first rejected login.
 # ---------------------------------------------------------------------------
-_DUMMY_HASH: str = _ph.hash("__greenops_timing_dummy_do_not_use__")
+@functools.cache
+def _dummy_hash() -> str:
+    return _ph.hash("__greenops_timing_dummy_do_not_use__")
+
+# Dedicated executor for Argon2 work. A single verify blocks a thread for
+# ~100 ms of memory-hard computation; run on the event loop it would stall
+# every in-flight request for that long. With single-lane hashes the pool
+# cap (4) is also the cap on concurrent Argon2 work — and on its peak
+# memory, 4 x 64 MiB — so login bursts queue instead of thrashing.
+_ARGON2_EXECUTOR = ThreadPoolExecutor(
+    max_workers=min(4, os.cpu_count() or 1),
+    thread_name_prefix="argon2",
+)
+
+# Static JWT bits hoisted out of the per-call path. The signing key is NOT
+# snapshotted here on purpose: in development Settings.validate() may inject
+# an auto-generated JWT_SECRET_KEY after this module is imported, so the key
+# must be read from the (cached) settings object at call time.
+_ACCESS_TOKEN_TTL = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+_REFRESH_TOKEN_TTL = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
 
 
 # ---------------------------------------------------------------------------
@@ -80,17 +116,65 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
+# needs_rehash() only depends on the parameter header of the encoded hash
+# ("$argon2id$v=19$m=65536,t=3,p=4"), never on the salt or digest. Caching
+# per distinct header means the answer is computed once per parameter set
+# seen, not re-parsed on every successful login.
+_REHASH_BY_PARAMS: dict = {}
+
+
 def needs_rehash(hashed_password: str) -> bool:
     """
     Return True if the stored hash was created with different PasswordHasher
     parameters than the current _ph and should be silently upgraded on next
     successful login.
     """
+    params = hashed_password.rsplit("$", 2)[0]
+    cached = _REHASH_BY_PARAMS.get(params)
+    if cached is not None:
+        return cached
     try:
-        return _ph.check_needs_rehash(hashed_password)
+        result = _ph.check_needs_rehash(hashed_password)
     except InvalidHashError:
         # Malformed hash in DB — treat as stale so it gets replaced.
+        # Not cached: a garbage prefix shouldn't occupy a cache slot.
         return True
+    if len(_REHASH_BY_PARAMS) < 64:
+        _REHASH_BY_PARAMS[params] = result
+    return result
+
+
+def verify_password_timing_safe(plain_password: str, hashed_password: Optional[str]) -> bool:
+    """
+    Credential check for login flows with a uniform timing profile.
+
+    Pass ``hashed_password=None`` when there is no real hash to check (user
+    not found, user inactive). The verification then runs against the
+    module-level dummy hash — created with the *current* PasswordHasher
+    parameters, so it costs the same as a real hash — and the result is
+    forced to False. Every call performs exactly one full memory-hard
+    Argon2 verification, leaving rejection paths indistinguishable by timing.
+    """
+    if hashed_password is None:
+        verify_password(plain_password, _dummy_hash())
+        return False
+    return verify_password(plain_password, hashed_password)
+
+
+async def verify_password_timing_safe_async(
+    plain_password: str, hashed_password: Optional[str]
+) -> bool:
+    """verify_password_timing_safe on the Argon2 executor, off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _ARGON2_EXECUTOR, verify_password_timing_safe, plain_password, hashed_password
+    )
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password on the Argon2 executor, off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _ARGON2_EXECUTOR, hash_password, password
+    )
 
 
 def timing_safe_dummy_verify() -> None:
@@ -103,7 +187,7 @@ def timing_safe_dummy_verify() -> None:
     this call, those paths return in <1 ms, leaking username validity.
     """
     # Always False — we never pass the matching input. The point is CPU time.
-    verify_password("__greenops_timing_dummy_input__", _DUMMY_HASH)
+    verify_password("__greenops_timing_dummy_input__", _dummy_hash())
 
 
 def create_access_token(
@@ -111,35 +195,80 @@ def create_access_token(
     username: str,
     role: str,
     expires_delta: Optional[timedelta] = None,
+    now: Optional[datetime] = None,
 ) -> Tuple[str, datetime]:
-    """Create a signed JWT access token. Returns (token, expires_at)."""
+    """
+    Create a signed JWT access token. Returns (token, expires_at).
+
+    Callers that already hold a request timestamp pass it as ``now`` so the
+    token's iat lines up with the rest of the request and no extra clock
+    read happens here.
+    """
     if expires_delta is None:
-        expires_delta = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    expire = datetime.now(timezone.utc) + expires_delta
+        expires_delta = _ACCESS_TOKEN_TTL
+    # iat/exp go in as integer epochs so PyJWT serializes them directly
+    # instead of converting datetimes itself.
+    if now is None:
+        now = datetime.now(timezone.utc)
+    expire = now + expires_delta
     payload = {
         "sub": str(user_id),
         "username": username,
         "role": role,
         "type": "access",
-        "iat": datetime.now(timezone.utc),
-        "exp": expire,
-        "jti": str(uuid.uuid4()),
+        "iat": int(now.timestamp()),
+        "exp": int(expire.timestamp()),
+        "jti": secrets.token_hex(16),
     }
     token = jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
     return token, expire
 
 
-def create_refresh_token() -> Tuple[str, str, datetime]:
-    """Return (raw_token, sha256_hex_hash, expires_at)."""
+def create_refresh_token(now: Optional[datetime] = None) -> Tuple[str, bytes, datetime]:
+    """Return (raw_token, sha256_digest, expires_at). ``now`` as in create_access_token."""
     raw_token = secrets.token_urlsafe(48)
-    token_hash = hashlib.sha256(raw_token.encode()).hexdigest()
-    expire = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    return raw_token, token_hash, expire
+    token_hash = hashlib.sha256(raw_token.encode()).digest()
+    if now is None:
+        now = datetime.now(timezone.utc)
+    return raw_token, token_hash, now + _REFRESH_TOKEN_TTL
 
 
-def hash_refresh_token(raw_token: str) -> str:
-    """Return SHA-256 hex digest of a refresh token."""
-    return hashlib.sha256(raw_token.encode()).hexdigest()
+def hash_refresh_token(raw_token: str) -> bytes:
+    """
+    Return the raw 32-byte SHA-256 digest of a refresh token (stored as
+    BYTEA — half the bytes on the wire of the old hex text, no hex codec).
+
+    A deliberate non-KDF: refresh tokens are 48 bytes of CSPRNG output, so
+    brute force is infeasible and Argon2/bcrypt-grade stretching would only
+    add ~ms of latency to every /refresh and /logout. A single SHA-256 is
+    microseconds and the DB lookup compares digests, never raw tokens.
+    """
+    return hashlib.sha256(raw_token.encode()).digest()
+
+
+# Successful decodes are cached briefly: a dashboard session presents the
+# same immutable token on every request, so re-running base64 + HMAC +
+# JSON parse each time is repeated work. Keys are keyed BLAKE2b digests of
+# the token (never the token itself), so cache memory holds no usable
+# credential and outside probes can't target specific slots. The TTL is
+# well below the token lifetime; expiry is still enforced on every hit.
+# All validators PyJWT would otherwise probe for are switched off
+# explicitly — the tokens carry no aud/iss/nbf claims, so those checks are
+# per-decode dict lookups that can never do anything.
+_DECODE_OPTIONS = {
+    "verify_signature": True,
+    "verify_exp": True,
+    "verify_aud": False,
+    "verify_iss": False,
+    "verify_nbf": False,
+    "verify_iat": False,
+    "require": [],
+}
+
+_TOKEN_CACHE_TTL_S = 30.0
+_TOKEN_CACHE_MAX = 4096
+_TOKEN_CACHE_KEY = secrets.token_bytes(32)
+_TOKEN_CACHE: dict = {}  # digest -> (cache_expires_monotonic, payload)
 
 
 def decode_access_token(token: str) -> Optional[dict]:
@@ -147,15 +276,27 @@ def decode_access_token(token: str) -> Optional[dict]:
     Decode and validate a JWT access token.
     Returns the payload dict on success, None on any failure.
     """
+    cache_key = hashlib.blake2b(
+        token.encode(), key=_TOKEN_CACHE_KEY, digest_size=16
+    ).digest()
+    entry = _TOKEN_CACHE.get(cache_key)
+    if entry is not None and time.monotonic() < entry[0]:
+        payload = entry[1]
+        if payload["exp"] > time.time():
+            return payload
+        return None
     try:
         payload = jwt.decode(
             token,
             settings.JWT_SECRET_KEY,
             algorithms=[settings.JWT_ALGORITHM],
-            options={"verify_exp": True},
+            options=_DECODE_OPTIONS,
         )
         if payload.get("type") != "access":
             return None
+        if len(_TOKEN_CACHE) >= _TOKEN_CACHE_MAX:
+            _TOKEN_CACHE.clear()
+        _TOKEN_CACHE[cache_key] = (time.monotonic() + _TOKEN_CACHE_TTL_S, payload)
         return payload
     except jwt.ExpiredSignatureError:
         return None
@@ -170,10 +311,14 @@ def generate_agent_token() -> Tuple[str, str]:
     Raw token is prefixed with 'agt_' for easy identification in logs.
     """
     raw_token = f"agt_{secrets.token_urlsafe(32)}"
-    token_hash = hashlib.sha256(raw_token.encode()).hexdigest()
-    return raw_token, token_hash
+    return raw_token, hash_agent_token(raw_token)
 
 
 def hash_agent_token(raw_token: str) -> str:
     """Return SHA-256 hex digest of an agent token."""
-    return hashlib.sha256(raw_token.encode()).hexdigest()
+    # UTF-8, not ascii: this also hashes whatever an attacker puts on the
+    # wire, and Starlette decodes header bytes as latin-1, so non-ASCII
+    # credentials must hash cleanly to a non-matching digest (-> 401)
+    # instead of raising. digest().hex() is marginally cheaper than
+    # hexdigest() in CPython.
+    return hashlib.sha256(raw_token.encode()).digest().hex()
@@ -1,16 +1,61 @@
 """GreenOps Energy Calculation Utilities"""
+import numpy as np
+
 from config import get_settings
 settings = get_settings()
 
+# Settings values bound once at import. The Pydantic Settings instance routes
+# every attribute read through the descriptor protocol, which is the dominant
+# cost of these one-multiply helpers on hot paths (heartbeat ingestion calls
+# all three per request). The watts→kWh division is folded into the constant
+# so each call is a single multiply against a plain module-level float.
+_KWH_PER_IDLE_SECOND = settings.IDLE_POWER_WATTS / 3_600_000.0
+_COST_PER_KWH = settings.ELECTRICITY_COST_PER_KWH
+_IDLE_THRESHOLD = settings.IDLE_THRESHOLD_SECONDS
+
 
 def calculate_energy_wasted(idle_seconds: float) -> float:
-    idle_hours = idle_seconds / 3600.0
-    return round(idle_hours * (settings.IDLE_POWER_WATTS / 1000.0), 6)
+    return round(idle_seconds * _KWH_PER_IDLE_SECOND, 6)
 
 
 def calculate_cost(energy_kwh: float) -> float:
-    return round(energy_kwh * settings.ELECTRICITY_COST_PER_KWH, 4)
+    return round(energy_kwh * _COST_PER_KWH, 4)
 
 
 def is_idle(idle_seconds: float) -> bool:
-    return idle_seconds >= settings.IDLE_THRESHOLD_SECONDS
+    return idle_seconds >= _IDLE_THRESHOLD
+
+
+def calculate_energy_wasted_batch(idle_seconds) -> np.ndarray:
+    """Vectorized calculate_energy_wasted for a whole batch of idle readings.
+
+    Accepts any sequence/array of idle seconds and returns kWh per reading as
+    one NumPy expression instead of N Python-level calls.
+    """
+    arr = np.asarray(idle_seconds, dtype=np.float64)
+    return arr * _KWH_PER_IDLE_SECOND
+
+
+def calculate_cost_batch(energy_kwh) -> np.ndarray:
+    """Vectorized calculate_cost for an array of kWh values."""
+    return np.asarray(energy_kwh, dtype=np.float64) * _COST_PER_KWH
+
+
+def is_idle_batch(idle_seconds) -> np.ndarray:
+    """Vectorized is_idle: one boolean mask for a batch of idle readings."""
+    return np.asarray(idle_seconds, dtype=np.float64) >= _IDLE_THRESHOLD
+
+
+def compute_energy_metrics(idle_seconds):
+    """Energy, cost and idle flags for a batch in one pass over the input.
+
+    Equivalent to calling the three batch helpers separately, but the
+    idle_seconds array is read from memory once and the cost reuses the
+    energy intermediate instead of recomputing from seconds. Returns
+    (energy_kwh, cost_usd, is_idle) as float64/float64/bool arrays.
+    """
+    arr = np.asarray(idle_seconds, dtype=np.float64)
+    energy = arr * _KWH_PER_IDLE_SECOND
+    cost = energy * _COST_PER_KWH
+    idle = arr >= _IDLE_THRESHOLD
+    return energy, cost, idle
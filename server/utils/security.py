@@ -1,51 +1,151 @@
 """GreenOps Security Dependencies"""
+import asyncio
+import time
+from datetime import datetime, timezone
 from typing import Optional
 import structlog
 from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from database import AsyncSession, AgentToken, User, get_db
+from sqlalchemy import bindparam, lambda_stmt, select, update
+from database import AsyncSession, AsyncSessionLocal, AgentToken, Machine, User, UserRole, get_db
 from utils.auth import decode_access_token, hash_agent_token
 
 logger = structlog.get_logger(__name__)
 bearer_scheme = HTTPBearer(auto_error=False)
 
+# ---------------------------------------------------------------------------
+# Cached statements — lambda_stmt memoizes the Core→SQL construction so each
+# select() tree is built once per process; per-request values travel as bind
+# parameters at execute() time. These two run on every authenticated request,
+# so they are the hottest statements in the codebase. Same pattern as
+# routers/auth.py and routers/dashboard.py.
+# ---------------------------------------------------------------------------
+
+_USER_BY_ID_STMT = lambda_stmt(
+    lambda: select(User).where(User.id == bindparam("uid"), User.is_active == True)
+)
+
+# LEFT OUTER JOIN so a valid token whose machine row is gone still surfaces
+# as 404 rather than collapsing into the 401 branch.
+_AGENT_TOKEN_MACHINE_STMT = lambda_stmt(
+    lambda: select(AgentToken, Machine)
+    .outerjoin(Machine, Machine.id == AgentToken.machine_id)
+    .where(AgentToken.token_hash == bindparam("thash"), AgentToken.revoked == False)
+)
+
+# ---------------------------------------------------------------------------
+# Rejection responses, built once at import. Every field FastAPI reads off an
+# HTTPException is immutable here, so raising the same instance per failure
+# skips the detail-dict and header-dict allocation on each rejected request —
+# which is exactly the path an auth flood exercises. Same pattern as
+# _INVALID_CREDENTIALS in routers/auth.py.
+# ---------------------------------------------------------------------------
+
+_UNAUTHORIZED = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail={"error": "unauthorized", "message": "Authentication required."},
+    headers={"WWW-Authenticate": "Bearer"},
+)
+_INVALID_TOKEN = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail={"error": "invalid_token", "message": "Token is invalid or expired."},
+    headers={"WWW-Authenticate": "Bearer"},
+)
+_USER_NOT_FOUND = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail={"error": "user_not_found", "message": "User not found or inactive."},
+)
+_FORBIDDEN = HTTPException(
+    status_code=status.HTTP_403_FORBIDDEN,
+    detail={"error": "forbidden", "message": "Admin access required."},
+)
+_AGENT_UNAUTHORIZED = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail={"error": "unauthorized", "message": "Agent token required."},
+)
+_AGENT_INVALID_TOKEN = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail={"error": "invalid_token", "message": "Agent token is invalid or revoked."},
+)
+_MACHINE_NOT_FOUND = HTTPException(
+    status_code=status.HTTP_404_NOT_FOUND,
+    detail={"error": "machine_not_found", "message": "Machine not found."},
+)
+
+# ---------------------------------------------------------------------------
+# last_used write coalescing.
+#
+# Every heartbeat used to dirty agent_token.last_used, turning each request's
+# commit into an extra row UPDATE for a column that only needs minute-level
+# resolution. Instead, authenticated agent requests record the timestamp in
+# this process-local buffer and a background task (started from main.py's
+# lifespan) drains it every _LAST_USED_FLUSH_INTERVAL_S in one executemany
+# UPDATE. All reads/writes of the dict happen between awaits on the single
+# event loop, so no lock is needed — same reasoning as the sweep cooldown in
+# routers/machines.py. Trade-off: last_used can lag by up to one flush
+# interval and pending entries are lost on a hard crash, both acceptable for
+# an audit/inventory column.
+# ---------------------------------------------------------------------------
+_LAST_USED_FLUSH_INTERVAL_S = 30.0
+_last_used_buffer: dict = {}  # AgentToken.id -> epoch seconds of latest use
+
+
+async def flush_agent_last_used() -> None:
+    """Drain the last_used buffer into a single batched UPDATE."""
+    if not _last_used_buffer:
+        return
+    pending = dict(_last_used_buffer)
+    _last_used_buffer.clear()
+    # Buffered values are raw epoch floats; materialize the tz-aware
+    # datetimes the column expects once per batch, not once per heartbeat.
+    params = [
+        {"b_id": token_id, "b_ts": datetime.fromtimestamp(ts, timezone.utc)}
+        for token_id, ts in pending.items()
+    ]
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(AgentToken)
+                .where(AgentToken.id == bindparam("b_id"))
+                .values(last_used=bindparam("b_ts")),
+                params,
+            )
+            await db.commit()
+    except Exception as exc:
+        # Put the timestamps back so the next flush retries them, without
+        # clobbering anything newer that arrived while the UPDATE ran.
+        for token_id, ts in pending.items():
+            _last_used_buffer.setdefault(token_id, ts)
+        logger.warning("agent_last_used_flush_failed", error=str(exc), pending=len(pending))
+
+
+async def agent_last_used_flush_loop() -> None:
+    """Periodic flush task; scheduled and cancelled by main.py's lifespan."""
+    while True:
+        await asyncio.sleep(_LAST_USED_FLUSH_INTERVAL_S)
+        await flush_agent_last_used()
+
 
 async def get_current_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Security(bearer_scheme),
     db: AsyncSession = Depends(get_db),
 ) -> User:
     if not credentials:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"error": "unauthorized", "message": "Authentication required."},
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _UNAUTHORIZED
     payload = decode_access_token(credentials.credentials)
     if not payload:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"error": "invalid_token", "message": "Token is invalid or expired."},
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    from sqlalchemy import select
+        raise _INVALID_TOKEN
     user_id = int(payload["sub"])
-    result = await db.execute(select(User).where(User.id == user_id, User.is_active == True))
+    result = await db.execute(_USER_BY_ID_STMT, {"uid": user_id})
     user = result.scalar_one_or_none()
     if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"error": "user_not_found", "message": "User not found or inactive."},
-        )
+        raise _USER_NOT_FOUND
     return user
 
 
 async def require_admin(current_user: User = Depends(get_current_user)) -> User:
-    from database import UserRole
     if current_user.role != UserRole.ADMIN:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail={"error": "forbidden", "message": "Admin access required."},
-        )
+        raise _FORBIDDEN
     return current_user
 
 
@@ -53,31 +153,18 @@ async def get_current_machine(
     credentials: Optional[HTTPAuthorizationCredentials] = Security(bearer_scheme),
     db: AsyncSession = Depends(get_db),
 ):
-    from database import Machine
-    from sqlalchemy import select
     if not credentials:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"error": "unauthorized", "message": "Agent token required."},
-        )
+        raise _AGENT_UNAUTHORIZED
     raw_token = credentials.credentials
     token_hash = hash_agent_token(raw_token)
-    result = await db.execute(
-        select(AgentToken).where(AgentToken.token_hash == token_hash, AgentToken.revoked == False)
-    )
-    agent_token = result.scalar_one_or_none()
-    if not agent_token:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"error": "invalid_token", "message": "Agent token is invalid or revoked."},
-        )
-    result = await db.execute(select(Machine).where(Machine.id == agent_token.machine_id))
-    machine = result.scalar_one_or_none()
+    # One round-trip instead of two sequential selects (token, then machine).
+    result = await db.execute(_AGENT_TOKEN_MACHINE_STMT, {"thash": token_hash})
+    row = result.one_or_none()
+    if row is None:
+        raise _AGENT_INVALID_TOKEN
+    agent_token, machine = row
     if not machine:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail={"error": "machine_not_found", "message": "Machine not found."},
-        )
-    from datetime import datetime, timezone
-    agent_token.last_used = datetime.now(timezone.utc)
+        raise _MACHINE_NOT_FOUND
+    # time.time() stores a bare C double; the datetime is built at flush.
+    _last_used_buffer[agent_token.id] = time.time()
     return machine